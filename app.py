@@ -9,6 +9,7 @@ import json
 import logging
 import os
 import traceback
+import orjson
 from dotenv import load_dotenv
 
 # Configure logging with more detail
@@ -62,6 +63,14 @@ def index():
         ]
     })
 
+def orjson_response(data, status: int = 200):
+    """Serialize large payloads with orjson instead of Flask's stdlib encoder"""
+    return app.response_class(
+        orjson.dumps(data, default=str),
+        status=status,
+        mimetype='application/json'
+    )
+
 @app.route('/api/dashboard', methods=['GET'])
 def get_dashboard_data():
     try:
@@ -126,7 +135,7 @@ def get_dashboard_data():
         }
         
         logger.info("Successfully prepared dashboard response")
-        return jsonify(response_data)
+        return orjson_response(response_data)
 
     except Exception as e:
         logger.error(f"Dashboard endpoint error: {str(e)}\n{traceback.format_exc()}")
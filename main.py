@@ -15,6 +15,7 @@ load_dotenv()
 from models.database import engine, Base
 from routes import aws_scan, reports, auth, monitor
 from services.monitor import CloudMonitor
+from services.notification_service import NotificationService
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -54,7 +55,7 @@ PDF_REPORT_TEMPLATE = "default"
 Base.metadata.create_all(bind=engine)
 
 # Create monitor instance
-monitor_instance = CloudMonitor()
+monitor_instance = CloudMonitor(notifier=NotificationService.from_env())
 
 app = FastAPI(
     title="Cloud Misconfiguration Scanner",
@@ -6,6 +6,7 @@ import logging
 
 from models.database import get_db, ScanResult
 from services.aws_scanner import AWSScanner
+from services.aws_config import BOTO_CONFIG
 
 router = APIRouter()
 scanner = AWSScanner()
@@ -89,7 +90,7 @@ async def get_resource_results(resource_id: str, db: Session = Depends(get_db)):
 async def check_security_hub_status():
     """Check if AWS Security Hub is enabled in the current region"""
     try:
-        securityhub = scanner.session.client('securityhub')
+        securityhub = scanner.session.client('securityhub', config=BOTO_CONFIG)
         try:
             response = securityhub.get_enabled_standards()
             return {
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, BackgroundTasks, HTTPException, status
 from services.monitor import CloudMonitor
+from services.notification_service import NotificationService
 from typing import Dict, Any
 import json
 from datetime import datetime
@@ -10,7 +11,7 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()  # Remove prefix, it's handled in main.py
-monitor = CloudMonitor()
+monitor = CloudMonitor(notifier=NotificationService.from_env())
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from services.monitor import CloudMonitor
+from services.notification_service import NotificationService
 import json
 import logging
 
@@ -8,7 +9,7 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-monitor = CloudMonitor()
+monitor = CloudMonitor(notifier=NotificationService.from_env())
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
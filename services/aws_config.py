@@ -0,0 +1,12 @@
+from botocore.config import Config
+
+# Shared client configuration for every boto3 client created by the scanners.
+# The default pool of 10 connections throttles concurrent scans, and the
+# legacy retry mode does not back off well under bursts of API calls.
+BOTO_CONFIG = Config(
+    max_pool_connections=64,
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+    tcp_keepalive=True,
+    connect_timeout=3,
+    read_timeout=10
+)
@@ -6,6 +6,7 @@ from datetime import datetime
 from .network_scanner import NetworkScanner
 from .compliance_checker import ComplianceChecker
 from .export_handler import ExportHandler
+from .aws_config import BOTO_CONFIG
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -43,16 +44,16 @@ class AWSScanner:
         """Initialize AWS clients with proper error handling"""
         try:
             # Test AWS connection first
-            sts = self.session.client('sts')
+            sts = self.session.client('sts', config=BOTO_CONFIG)
             identity = sts.get_caller_identity()
             logging.info(f"Authenticated as: {identity['Arn']}")
             
             # Initialize service clients
-            self.s3_client = self.session.client('s3')
-            self.iam_client = self.session.client('iam')
-            self.securityhub_client = self.session.client('securityhub')
-            self.ec2_client = self.session.client('ec2')
-            self.rds_client = self.session.client('rds')
+            self.s3_client = self.session.client('s3', config=BOTO_CONFIG)
+            self.iam_client = self.session.client('iam', config=BOTO_CONFIG)
+            self.securityhub_client = self.session.client('securityhub', config=BOTO_CONFIG)
+            self.ec2_client = self.session.client('ec2', config=BOTO_CONFIG)
+            self.rds_client = self.session.client('rds', config=BOTO_CONFIG)
             
             # Test each service
             self.s3_client.list_buckets()
@@ -410,17 +411,17 @@ class AWSScanner:
         
         # Export results
         exported_files = {}
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        ts = datetime.now()
         
         for format in export_formats:
             if format == 'json':
-                filepath = self.export_handler.export_json(results, f"scan_results_{timestamp}.json")
+                filepath = self.export_handler.export_json(results, ts=ts)
                 exported_files['json'] = filepath
             elif format == 'csv':
-                filepath = self.export_handler.export_csv(results, f"scan_results_{timestamp}.csv")
+                filepath = self.export_handler.export_csv(results, ts=ts)
                 exported_files['csv'] = filepath
             elif format == 'pdf':
-                filepath = self.export_handler.export_pdf(results, f"scan_results_{timestamp}.pdf")
+                filepath = self.export_handler.export_pdf(results, ts=ts)
                 exported_files['pdf'] = filepath
             else:
                 logging.warning(f"Unsupported export format: {format}")
@@ -431,7 +432,7 @@ class AWSScanner:
         """Test AWS connection and credentials"""
         try:
             # Try to list S3 buckets as a simple test
-            s3 = self.session.client('s3')
+            s3 = self.session.client('s3', config=BOTO_CONFIG)
             s3.list_buckets()
             return True
         except Exception as e:
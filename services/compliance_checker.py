@@ -1,16 +1,115 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, Optional
 import boto3
 from datetime import datetime
+import csv
+import io
 import logging
+import time
+from botocore.exceptions import ClientError
 from datetime import timezone
+from .aws_config import BOTO_CONFIG
+
+def _ebs_encryption_control(volume: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the CIS 2.2.1 control for a single EBS volume"""
+    encrypted = volume.get('Encrypted', False)
+    return {
+        'id': 'CIS.2.2.1',
+        'title': 'EBS Encryption',
+        'status': 'PASS' if encrypted else 'FAIL',
+        'description': f'Volume {volume["VolumeId"]} encryption is enabled' if encrypted else f'Volume {volume["VolumeId"]} is not encrypted'
+    }
+
+def _security_group_rule_control(sg: Dict[str, Any], rule: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the AC-3 control for a single security group rule"""
+    unrestricted = any(ip_range.get('CidrIp') == '0.0.0.0/0' for ip_range in rule.get('IpRanges', []))
+    return {
+        'id': 'NIST.AC-3',
+        'title': 'Security Group Access',
+        'status': 'FAIL' if unrestricted else 'PASS',
+        'description': f'Security group {sg["GroupId"]} allows unrestricted access' if unrestricted else f'Security group {sg["GroupId"]} has restricted access'
+    }
+
+def _listener_control(listener: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the SC-8 control for a single load balancer listener"""
+    secure = listener['Protocol'] in ['HTTPS', 'TLS']
+    return {
+        'id': 'NIST.SC-8',
+        'title': 'Load Balancer Transmission Security',
+        'status': 'PASS' if secure else 'FAIL',
+        'description': f'Listener {listener["ListenerArn"]} uses secure protocol' if secure else f'Listener {listener["ListenerArn"]} uses insecure protocol'
+    }
+
+def _mfa_control(username: str, mfa_active: bool, details: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the PCI 8.3 control for a single IAM user"""
+    return {
+        'id': 'PCI.8.3',
+        'title': 'IAM User MFA Authentication',
+        'status': 'PASS' if mfa_active else 'FAIL',
+        'description': f'User {username} has MFA enabled' if mfa_active else f'User {username} does not have MFA enabled',
+        'details': dict(details)
+    }
+
+def _rds_encryption_control(db: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the PCI 3.4 control for a single RDS instance"""
+    encrypted = db['StorageEncrypted']
+    return {
+        'id': 'PCI.3.4',
+        'title': 'RDS Data Protection',
+        'status': 'PASS' if encrypted else 'FAIL',
+        'description': f'Database {db["DBInstanceIdentifier"]} storage is encrypted' if encrypted else f'Database {db["DBInstanceIdentifier"]} storage is not encrypted'
+    }
 
 class ComplianceChecker:
+    # How long the IAM credential report is reused across framework checks
+    CREDENTIAL_REPORT_TTL = 60
+    CREDENTIAL_REPORT_POLL_ATTEMPTS = 10
+    CREDENTIAL_REPORT_POLL_INTERVAL = 1
+    ROOT_ACCOUNT_USER = '<root_account>'
+
     def __init__(self, session: boto3.Session):
         self.session = session
-        self.ec2_client = session.client('ec2')
-        self.s3_client = session.client('s3')
-        self.iam_client = session.client('iam')
-        self.rds_client = session.client('rds')
+        self.ec2_client = session.client('ec2', config=BOTO_CONFIG)
+        self.s3_client = session.client('s3', config=BOTO_CONFIG)
+        self.iam_client = session.client('iam', config=BOTO_CONFIG)
+        self.rds_client = session.client('rds', config=BOTO_CONFIG)
+        self.elbv2_client = session.client('elbv2', config=BOTO_CONFIG)
+        self.kms_client = session.client('kms', config=BOTO_CONFIG)
+        self._credential_report = None
+        self._credential_report_at = 0.0
+        self._credential_report_generated: Optional[datetime] = None
+
+    def _fetch_credential_report(self) -> List[Dict[str, str]]:
+        """Generate and parse the IAM credential report, recording when AWS generated it"""
+        for _ in range(self.CREDENTIAL_REPORT_POLL_ATTEMPTS):
+            if self.iam_client.generate_credential_report()['State'] == 'COMPLETE':
+                break
+            time.sleep(self.CREDENTIAL_REPORT_POLL_INTERVAL)
+        report = self.iam_client.get_credential_report()
+        self._credential_report_generated = report.get('GeneratedTime')
+        # boto3 already base64-decodes the blob, Content is the raw CSV
+        content = report['Content'].decode('utf-8')
+        return list(csv.DictReader(io.StringIO(content)))
+
+    def _iter_credential_report_users(self) -> Iterator[Dict[str, str]]:
+        """Yield one credential report row per IAM user, shared across checks for CREDENTIAL_REPORT_TTL seconds
+
+        AWS hands back the existing credential report until it is 4 hours old, so MFA and
+        key rotation results can lag IAM by up to that long regardless of the TTL; controls
+        built from these rows carry _credential_report_details() so the report age is visible.
+        Requires the iam:GenerateCredentialReport and iam:GetCredentialReport permissions.
+        """
+        now = time.monotonic()
+        if self._credential_report is None or now - self._credential_report_at > self.CREDENTIAL_REPORT_TTL:
+            self._credential_report = self._fetch_credential_report()
+            self._credential_report_at = now
+        for row in self._credential_report:
+            if row['user'] != self.ROOT_ACCOUNT_USER:
+                yield row
+
+    def _credential_report_details(self) -> Dict[str, Any]:
+        """Control details identifying the credential report a result was read from"""
+        generated = self._credential_report_generated
+        return {'credential_report_generated': generated.isoformat() if generated else None}
 
     def _calculate_score(self, controls: List[Dict[str, Any]]) -> float:
         """Calculate compliance score based on control results"""
@@ -179,21 +278,26 @@ class ComplianceChecker:
         try:
             buckets = self.s3_client.list_buckets()['Buckets']
             for bucket in buckets:
+                bucket_name = bucket['Name']
                 try:
-                    policy = self.s3_client.get_bucket_policy(Bucket=bucket['Name'])
-                    controls.append({
-                        'id': 'CIS.2.1.1',
-                        'title': 'S3 Bucket Policy',
-                        'status': 'PASS',
-                        'description': f'Bucket {bucket["Name"]} has a policy configured'
-                    })
-                except:
-                    controls.append({
-                        'id': 'CIS.2.1.1',
-                        'title': 'S3 Bucket Policy',
-                        'status': 'FAIL',
-                        'description': f'Bucket {bucket["Name"]} has no policy configured'
-                    })
+                    self.s3_client.get_bucket_policy(Bucket=bucket_name)
+                    status = 'PASS'
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'NoSuchBucketPolicy':
+                        controls.append({
+                            'id': 'CIS.2.1.1',
+                            'title': 'S3 Bucket Policy',
+                            'status': 'ERROR',
+                            'description': f'Error checking policy for bucket {bucket_name}: {str(e)}'
+                        })
+                        continue
+                    status = 'FAIL'
+                controls.append({
+                    'id': 'CIS.2.1.1',
+                    'title': 'S3 Bucket Policy',
+                    'status': status,
+                    'description': f'Bucket {bucket_name} has a policy configured' if status == 'PASS' else f'Bucket {bucket_name} has no policy configured'
+                })
         except Exception as e:
             controls.append({
                 'id': 'CIS.2.1.1',
@@ -208,13 +312,7 @@ class ComplianceChecker:
         controls = []
         try:
             volumes = self.ec2_client.describe_volumes()['Volumes']
-            for volume in volumes:
-                controls.append({
-                    'id': 'CIS.2.2.1',
-                    'title': 'EBS Encryption',
-                    'status': 'PASS' if volume.get('Encrypted', False) else 'FAIL',
-                    'description': f'Volume {volume["VolumeId"]} encryption is enabled' if volume.get('Encrypted', False) else f'Volume {volume["VolumeId"]} is not encrypted'
-                })
+            controls.extend(_ebs_encryption_control(volume) for volume in volumes)
         except Exception as e:
             controls.append({
                 'id': 'CIS.2.2.1',
@@ -249,12 +347,13 @@ class ComplianceChecker:
                         'description': f'{description} meets requirements' if status == 'PASS' else f'{description} does not meet requirements'
                     })
 
-        except self.iam_client.exceptions.NoSuchEntityException:
+        except ClientError as e:
+            no_policy = e.response['Error']['Code'] == 'NoSuchEntity'
             controls.append({
                 'id': 'CIS.1.4',
                 'title': 'IAM Password Policy',
-                'status': 'FAIL',
-                'description': 'No password policy is set'
+                'status': 'FAIL' if no_policy else 'ERROR',
+                'description': 'No password policy is set' if no_policy else f'Error checking password policy: {str(e)}'
             })
         except Exception as e:
             controls.append({
@@ -271,22 +370,11 @@ class ComplianceChecker:
         try:
             # Check Security Groups
             sgs = self.ec2_client.describe_security_groups()['SecurityGroups']
-            for sg in sgs:
-                for rule in sg['IpPermissions']:
-                    if any(ip_range.get('CidrIp') == '0.0.0.0/0' for ip_range in rule.get('IpRanges', [])):
-                        controls.append({
-                            'id': 'NIST.AC-3',
-                            'title': 'Security Group Access',
-                            'status': 'FAIL',
-                            'description': f'Security group {sg["GroupId"]} allows unrestricted access'
-                        })
-                    else:
-                        controls.append({
-                            'id': 'NIST.AC-3',
-                            'title': 'Security Group Access',
-                            'status': 'PASS',
-                            'description': f'Security group {sg["GroupId"]} has restricted access'
-                        })
+            controls.extend(
+                _security_group_rule_control(sg, rule)
+                for sg in sgs
+                for rule in sg['IpPermissions']
+            )
         except Exception as e:
             controls.append({
                 'id': 'NIST.AC-3',
@@ -301,23 +389,8 @@ class ComplianceChecker:
         controls = []
         try:
             # Check Load Balancer SSL policies
-            elb = self.session.client('elbv2')
-            listeners = elb.describe_listeners()['Listeners']
-            for listener in listeners:
-                if listener['Protocol'] in ['HTTPS', 'TLS']:
-                    controls.append({
-                        'id': 'NIST.SC-8',
-                        'title': 'Load Balancer Transmission Security',
-                        'status': 'PASS',
-                        'description': f'Listener {listener["ListenerArn"]} uses secure protocol'
-                    })
-                else:
-                    controls.append({
-                        'id': 'NIST.SC-8',
-                        'title': 'Load Balancer Transmission Security',
-                        'status': 'FAIL',
-                        'description': f'Listener {listener["ListenerArn"]} uses insecure protocol'
-                    })
+            listeners = self.elbv2_client.describe_listeners()['Listeners']
+            controls.extend(_listener_control(listener) for listener in listeners)
         except Exception as e:
             controls.append({
                 'id': 'NIST.SC-8',
@@ -327,29 +400,24 @@ class ComplianceChecker:
             })
         return controls
 
+    def _kms_key_control(self, key: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the SC-13 control for a single KMS key"""
+        key_state = self.kms_client.describe_key(KeyId=key['KeyId'])['KeyMetadata']['KeyState']
+        enabled = key_state == 'Enabled'
+        return {
+            'id': 'NIST.SC-13',
+            'title': 'KMS Key Cryptographic Protection',
+            'status': 'PASS' if enabled else 'FAIL',
+            'description': f'KMS key {key["KeyId"]} is enabled and available' if enabled else f'KMS key {key["KeyId"]} is in {key_state} state'
+        }
+
     def _check_cryptographic_protection(self) -> List[Dict[str, Any]]:
         """Check NIST SC-13 Cryptographic Protection controls"""
         controls = []
         try:
             # Check KMS keys
-            kms = self.session.client('kms')
-            keys = kms.list_keys()['Keys']
-            for key in keys:
-                key_info = kms.describe_key(KeyId=key['KeyId'])['KeyMetadata']
-                if key_info['KeyState'] == 'Enabled':
-                    controls.append({
-                        'id': 'NIST.SC-13',
-                        'title': 'KMS Key Cryptographic Protection',
-                        'status': 'PASS',
-                        'description': f'KMS key {key["KeyId"]} is enabled and available'
-                    })
-                else:
-                    controls.append({
-                        'id': 'NIST.SC-13',
-                        'title': 'KMS Key Cryptographic Protection',
-                        'status': 'FAIL',
-                        'description': f'KMS key {key["KeyId"]} is in {key_info["KeyState"]} state'
-                    })
+            keys = self.kms_client.list_keys()['Keys']
+            controls.extend(self._kms_key_control(key) for key in keys)
         except Exception as e:
             controls.append({
                 'id': 'NIST.SC-13',
@@ -359,28 +427,24 @@ class ComplianceChecker:
             })
         return controls
 
+    def _role_policy_control(self, role: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the PCI 7.1 control for a single IAM role"""
+        attached_policies = self.iam_client.list_attached_role_policies(RoleName=role['RoleName'])
+        has_policies = bool(attached_policies['AttachedPolicies'])
+        return {
+            'id': 'PCI.7.1',
+            'title': 'IAM Role Access Control',
+            'status': 'PASS' if has_policies else 'FAIL',
+            'description': f'Role {role["RoleName"]} has defined policies' if has_policies else f'Role {role["RoleName"]} has no attached policies'
+        }
+
     def _check_pci_access_controls(self) -> List[Dict[str, Any]]:
         """Check PCI DSS Requirement 7 controls"""
         controls = []
         try:
             # Check IAM roles and policies
             roles = self.iam_client.list_roles()['Roles']
-            for role in roles:
-                attached_policies = self.iam_client.list_attached_role_policies(RoleName=role['RoleName'])
-                if attached_policies['AttachedPolicies']:
-                    controls.append({
-                        'id': 'PCI.7.1',
-                        'title': 'IAM Role Access Control',
-                        'status': 'PASS',
-                        'description': f'Role {role["RoleName"]} has defined policies'
-                    })
-                else:
-                    controls.append({
-                        'id': 'PCI.7.1',
-                        'title': 'IAM Role Access Control',
-                        'status': 'FAIL',
-                        'description': f'Role {role["RoleName"]} has no attached policies'
-                    })
+            controls.extend(self._role_policy_control(role) for role in roles)
         except Exception as e:
             controls.append({
                 'id': 'PCI.7.1',
@@ -395,23 +459,9 @@ class ComplianceChecker:
         controls = []
         try:
             # Check IAM users MFA status
-            users = self.iam_client.list_users()['Users']
-            for user in users:
-                mfa_devices = self.iam_client.list_mfa_devices(UserName=user['UserName'])
-                if mfa_devices['MFADevices']:
-                    controls.append({
-                        'id': 'PCI.8.3',
-                        'title': 'IAM User MFA Authentication',
-                        'status': 'PASS',
-                        'description': f'User {user["UserName"]} has MFA enabled'
-                    })
-                else:
-                    controls.append({
-                        'id': 'PCI.8.3',
-                        'title': 'IAM User MFA Authentication',
-                        'status': 'FAIL',
-                        'description': f'User {user["UserName"]} does not have MFA enabled'
-                    })
+            users = list(self._iter_credential_report_users())
+            details = self._credential_report_details()
+            controls.extend(_mfa_control(row['user'], row['mfa_active'] == 'true', details) for row in users)
         except Exception as e:
             controls.append({
                 'id': 'PCI.8.3',
@@ -427,21 +477,7 @@ class ComplianceChecker:
         try:
             # Check RDS encryption
             dbs = self.rds_client.describe_db_instances()
-            for db in dbs['DBInstances']:
-                if db['StorageEncrypted']:
-                    controls.append({
-                        'id': 'PCI.3.4',
-                        'title': 'RDS Data Protection',
-                        'status': 'PASS',
-                        'description': f'Database {db["DBInstanceIdentifier"]} storage is encrypted'
-                    })
-                else:
-                    controls.append({
-                        'id': 'PCI.3.4',
-                        'title': 'RDS Data Protection',
-                        'status': 'FAIL',
-                        'description': f'Database {db["DBInstanceIdentifier"]} storage is not encrypted'
-                    })
+            controls.extend(_rds_encryption_control(db) for db in dbs['DBInstances'])
         except Exception as e:
             controls.append({
                 'id': 'PCI.3.4',
@@ -476,35 +512,41 @@ class ComplianceChecker:
         """Check IAM user security settings"""
         try:
             results = []
-            users = self.iam_client.list_users()['Users']
             
-            for user in users:
-                username = user['UserName']
+            now = datetime.now(timezone.utc)
+            users = list(self._iter_credential_report_users())
+            details = self._credential_report_details()
+            
+            for row in users:
+                username = row['user']
                 
                 # Skip root user check as we know it has MFA
                 if username == 'root':
                     continue
                 
                 # Check MFA
-                mfa_devices = self.iam_client.list_mfa_devices(UserName=username)['MFADevices']
-                if not mfa_devices:
+                if row['mfa_active'] != 'true':
                     results.append({
                         'id': 'PCI.8.3',
                         'title': 'IAM User MFA Authentication',
                         'status': 'FAIL',
-                        'description': f'User {username} does not have MFA enabled'
+                        'description': f'User {username} does not have MFA enabled',
+                        'details': dict(details)
                     })
                 
                 # Check access keys age
-                access_keys = self.iam_client.list_access_keys(UserName=username)['AccessKeyMetadata']
-                for key in access_keys:
-                    key_age = (datetime.now(timezone.utc) - key['CreateDate']).days
+                for key_field in ('access_key_1_last_rotated', 'access_key_2_last_rotated'):
+                    last_rotated = row.get(key_field, 'N/A')
+                    if last_rotated in ('N/A', 'not_supported', ''):
+                        continue
+                    key_age = (now - datetime.fromisoformat(last_rotated)).days
                     if key_age > 90:
                         results.append({
                             'id': 'CIS.1.3',
                             'title': 'IAM Access Key Rotation',
                             'status': 'FAIL',
-                            'description': f'Access key for user {username} is {key_age} days old'
+                            'description': f'Access key for user {username} is {key_age} days old',
+                            'details': dict(details)
                         })
             
             return results
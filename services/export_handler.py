@@ -1,92 +1,149 @@
 import json
 import csv
-from typing import Dict, Any, List
+from collections import Counter
+from typing import Dict, Any, Iterator, Optional
 from datetime import datetime
 import os
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 class ExportHandler:
+    # Large write buffer so exports are flushed in a few big writes
+    WRITE_BUFFER_SIZE = 1024 * 1024
+    # Union of the compliance and misconfiguration row shapes from _iter_flattened
+    CSV_FIELDNAMES = ['Framework', 'Control ID', 'Resource', 'Status', 'Description',
+                      'Service', 'Resource ID', 'Issue Type', 'Severity']
+    # Maximum issue rows per PDF detail table
+    PDF_TABLE_CHUNK_ROWS = 500
+    PDF_DETAIL_HEADER = ('Resource', 'Issue', 'Severity')
+    # PDF styles shared by every export, built on first PDF export
+    _pdf_styles: Optional[Dict[str, Any]] = None
+
     def __init__(self, output_dir: str = "reports"):
         """Initialize ExportHandler with output directory"""
-        self.output_dir = output_dir
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        self.output_dir = os.fspath(output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
 
-    def export_json(self, data: Dict[str, Any], filename: str = None) -> str:
-        """Export data to JSON format"""
+    def _build_path(self, ext: str, filename: Optional[str] = None, ts: Optional[datetime] = None) -> str:
+        """Resolve the output path, defaulting to a scan_results file name stamped with ts"""
         if filename is None:
-            filename = f"scan_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            filename = f"scan_results_{(ts or datetime.now()).strftime('%Y%m%d_%H%M%S')}.{ext}"
+        return os.path.join(self.output_dir, filename)
+
+    def export_json(self, data: Dict[str, Any], filename: str = None, ts: Optional[datetime] = None) -> str:
+        """Export data to JSON format"""
+        filepath = self._build_path('json', filename, ts)
+        if orjson is not None:
+            payload = orjson.dumps(data, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        else:
+            payload = json.dumps(data, indent=2, default=str).encode('utf-8')
         
-        filepath = os.path.join(self.output_dir, filename)
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2, default=str)
+        # Serialize fully in memory, then hand the whole document to the file in one write;
+        # payloads larger than the buffer bypass it and go straight to the OS
+        with open(filepath, 'wb', buffering=self.WRITE_BUFFER_SIZE) as f:
+            f.write(payload)
         
         return filepath
 
-    def export_csv(self, data: Dict[str, Any], filename: str = None) -> str:
+    def export_csv(self, data: Dict[str, Any], filename: str = None, ts: Optional[datetime] = None) -> str:
         """Export data to CSV format"""
-        if filename is None:
-            filename = f"scan_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        filepath = os.path.join(self.output_dir, filename)
+        filepath = self._build_path('csv', filename, ts)
         
-        # Flatten the data structure
-        flattened_data = self._flatten_data(data)
-        
-        if not flattened_data:
-            # Create empty file with headers if no data
-            with open(filepath, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Service', 'Resource ID', 'Issue Type', 'Severity', 'Description',
-                               'Framework', 'Control ID', 'Status'])
-            return filepath
-        
-        # Get all possible keys from flattened data
-        fieldnames = set()
-        for item in flattened_data:
-            fieldnames.update(item.keys())
-        fieldnames = sorted(list(fieldnames))
-        
-        # Write to CSV
-        with open(filepath, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            for row in flattened_data:
-                # Ensure all fields exist in each row
-                for field in fieldnames:
-                    if field not in row:
-                        row[field] = ''
-                writer.writerow(row)
+        # Stream flattened rows into a temporary file and move it into place only once
+        # every row is written, so a malformed entry never leaves a partial CSV behind
+        tmp_path = f"{filepath}.tmp"
+        try:
+            with open(tmp_path, 'w', newline='', buffering=self.WRITE_BUFFER_SIZE, encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=self.CSV_FIELDNAMES, restval='', extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(self._iter_flattened(data))
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
         
         return filepath
 
-    def export_pdf(self, data: Dict[str, Any], filename: str = None) -> str:
+    @classmethod
+    def _get_pdf_styles(cls) -> Dict[str, Any]:
+        """Build the reportlab styles once, importing reportlab only when a PDF is exported"""
+        if cls._pdf_styles is None:
+            from reportlab.lib import colors
+            from reportlab.platypus import TableStyle
+            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+            sheet = getSampleStyleSheet()
+            cls._pdf_styles = {
+                'sheet': sheet,
+                'title': ParagraphStyle(
+                    'CustomTitle',
+                    parent=sheet['Heading1'],
+                    fontSize=24,
+                    spaceAfter=30
+                ),
+                'summary_table': TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 14),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 1), (-1, -1), 12),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+                ]),
+                'detail_table': TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 12),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 1), (-1, -1), 10),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+                ])
+            }
+        return cls._pdf_styles
+
+    def export_pdf(self, data: Dict[str, Any], filename: str = None, ts: Optional[datetime] = None) -> str:
         """Export data to PDF format"""
-        if filename is None:
-            filename = f"scan_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        ts = ts or datetime.now()
+        filepath = self._build_path('pdf', filename, ts)
         
-        filepath = os.path.join(self.output_dir, filename)
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
         
         # Create PDF document
         doc = SimpleDocTemplate(filepath, pagesize=letter)
-        styles = getSampleStyleSheet()
+        pdf_styles = self._get_pdf_styles()
+        styles = pdf_styles['sheet']
         elements = []
 
         # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30
-        )
-        elements.append(Paragraph("Cloud Misconfiguration Scan Report", title_style))
-        elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["Normal"]))
+        elements.append(Paragraph("Cloud Misconfiguration Scan Report", pdf_styles['title']))
+        elements.append(Paragraph(f"Generated on: {ts.strftime('%Y-%m-%d %H:%M:%S')}", styles["Normal"]))
         elements.append(Spacer(1, 20))
 
+        # Fast path: nothing to report, skip the compliance and per-service sections
+        has_issues = any(
+            item.get('misconfigurations')
+            for service in ('s3', 'ec2', 'iam', 'rds', 'network')
+            for item in data.get(service, [])
+        )
+        if not has_issues and not data.get('compliance'):
+            elements.append(Paragraph("No issues detected", styles["Normal"]))
+            doc.build(elements)
+            return filepath
+
         # Add compliance summary
         if 'compliance' in data:
             elements.append(Paragraph("Compliance Summary", styles['Heading2']))
@@ -95,10 +152,10 @@ class ExportHandler:
             for framework, results in data['compliance'].items():
                 elements.append(Paragraph(f"{framework.upper()} Compliance", styles['Heading3']))
                 
-                # Calculate compliance statistics
+                # Calculate compliance statistics in one pass over the controls
+                statuses = Counter(control['status'] for control in results['controls'])
                 total_controls = len(results['controls'])
-                passed = len([c for c in results['controls'] if c['status'] == 'PASS'])
-                failed = len([c for c in results['controls'] if c['status'] == 'FAIL'])
+                passed, failed = statuses['PASS'], statuses['FAIL']
                 
                 # Create summary table
                 summary_data = [
@@ -112,19 +169,7 @@ class ExportHandler:
                 ]
                 
                 summary_table = Table(summary_data)
-                summary_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 14),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                    ('FONTSIZE', (0, 1), (-1, -1), 12),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
+                summary_table.setStyle(pdf_styles['summary_table'])
                 elements.append(summary_table)
                 elements.append(Spacer(1, 20))
 
@@ -139,31 +184,18 @@ class ExportHandler:
                     
                     misconfigs = data[service]
                     if misconfigs:
-                        table_data = [['Resource', 'Issue', 'Severity']]
-                        for item in misconfigs:
-                            for issue in item.get('misconfigurations', []):
-                                table_data.append([
-                                    item.get('resource_id', 'N/A'),
-                                    issue.get('description', 'N/A'),
-                                    issue.get('severity', 'N/A')
-                                ])
+                        rows = [
+                            (item.get('resource_id', 'N/A'), issue.get('description', 'N/A'), issue.get('severity', 'N/A'))
+                            for item in misconfigs
+                            for issue in item.get('misconfigurations', ())
+                        ]
                         
-                        if len(table_data) > 1:  # Only create table if there are issues
-                            table = Table(table_data)
-                            table.setStyle(TableStyle([
-                                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                                ('FONTSIZE', (0, 1), (-1, -1), 10),
-                                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                            ]))
-                            elements.append(table)
+                        if rows:  # Only create tables if there are issues
+                            # Table layout is super-linear in row count, so split large tables
+                            for start in range(0, len(rows), self.PDF_TABLE_CHUNK_ROWS):
+                                table = Table([self.PDF_DETAIL_HEADER, *rows[start:start + self.PDF_TABLE_CHUNK_ROWS]])
+                                table.setStyle(pdf_styles['detail_table'])
+                                elements.append(table)
                             elements.append(Spacer(1, 20))
                         else:
                             elements.append(Paragraph("No issues found", styles["Normal"]))
@@ -173,35 +205,29 @@ class ExportHandler:
         doc.build(elements)
         return filepath
 
-    def _flatten_data(self, data: Dict[str, Any], prefix: str = '') -> List[Dict[str, Any]]:
-        """Flatten nested dictionary structure for CSV export"""
-        flattened = []
-        
+    def _iter_flattened(self, data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Yield flattened rows of the nested scan structure for CSV export"""
         # Handle compliance data
         if 'compliance' in data:
             for framework, results in data['compliance'].items():
                 for control in results['controls']:
-                    row = {
+                    yield {
                         'Framework': framework.upper(),
                         'Control ID': control['control_id'],
                         'Resource': control['resource'],
                         'Status': control['status'],
                         'Description': control['description']
                     }
-                    flattened.append(row)
 
         # Handle misconfiguration data
         for service in ['s3', 'ec2', 'iam', 'rds', 'network']:
             if service in data:
                 for item in data[service]:
                     for issue in item.get('misconfigurations', []):
-                        row = {
+                        yield {
                             'Service': service.upper(),
                             'Resource ID': item.get('resource_id', 'N/A'),
                             'Issue Type': issue.get('type', 'N/A'),
                             'Severity': issue.get('severity', 'N/A'),
                             'Description': issue.get('description', 'N/A')
                         }
-                        flattened.append(row)
-
-        return flattened
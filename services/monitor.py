@@ -1,18 +1,45 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from functools import partial
+import hashlib
 import json
 from fastapi import WebSocket
 from .aws_scanner import AWSScanner
+from .notification_service import NotificationService
 import boto3
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Per-scan timestamps that change on every scan and must not count as a resource change
+_VOLATILE_KEYS = ('scan_date', 'timestamp')
+
+def _fingerprint(resource: Dict[str, Any]) -> bytes:
+    """Return a stable 16-byte digest of a scanned resource, ignoring per-scan timestamps"""
+    stable = {k: v for k, v in resource.items() if k not in _VOLATILE_KEYS}
+    if orjson is not None:
+        encoded = orjson.dumps(stable, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    else:
+        encoded = json.dumps(stable, default=str, sort_keys=True).encode()
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
 class CloudMonitor:
-    def __init__(self, scan_interval: int = 300):  # Default 5 minutes
+    # Pending change notifications beyond this are dropped to keep the scan cadence
+    NOTIFY_QUEUE_SIZE = 256
+
+    def __init__(self, scan_interval: int = 300, notifier: Optional[NotificationService] = None):  # Default 5 minutes
         self.scanner = AWSScanner()
         self.scan_interval = scan_interval
-        self.active_connections: List[WebSocket] = []
+        self.notifier = notifier
+        self._notify_queue: Optional[asyncio.Queue] = None
+        self._notify_task = None
+        self.active_connections: Set[WebSocket] = set()
         self.last_scan_results: Dict[str, Any] = {}
+        self.last_fingerprints: Dict[str, Dict[str, bytes]] = {}
         self.is_running = False
         self.current_scan_task = None
         self._initialize_logging()
@@ -28,7 +55,7 @@ class CloudMonitor:
     async def connect(self, websocket: WebSocket):
         """Handle new WebSocket connection"""
         # Note: websocket.accept() should be called by the route handler
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
         self.logger.info(f"New WebSocket connection established. Total connections: {len(self.active_connections)}")
         
         # Send initial scan results if available
@@ -40,65 +67,83 @@ class CloudMonitor:
     
     def disconnect(self, websocket: WebSocket):
         """Handle WebSocket disconnection"""
-        self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
         self.logger.info(f"WebSocket connection closed. Remaining connections: {len(self.active_connections)}")
     
     async def broadcast(self, message: Dict[str, Any]):
         """Broadcast message to all connected clients"""
         self.logger.debug(f"Broadcasting message: {message.get('type', 'unknown')}")
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                self.logger.error(f"Error broadcasting to client: {str(e)}")
-                self.active_connections.remove(connection)
+        connections = list(self.active_connections)
+        results = await asyncio.gather(
+            *(connection.send_json(message) for connection in connections),
+            return_exceptions=True
+        )
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"Error broadcasting to client: {str(result)}")
+                self.active_connections.discard(connection)
     
     async def scan_and_compare(self) -> Optional[Dict[str, Any]]:
         """Perform a scan and compare with previous results"""
-        scan_start = datetime.utcnow()
+        # Single timezone-aware UTC clock read per scan, reused by broadcasts and notifications
+        scan_start = datetime.now(timezone.utc)
+        scan_ts_iso = scan_start.isoformat()
         self.logger.info("Starting new scan...")
         
         try:
-            # Scan each service independently to improve performance
+            # Scan services concurrently in the default executor, broadcasting each as it finishes
             services_to_scan = ['s3', 'ec2', 'iam', 'rds']
             current_scan = {}
+            loop = asyncio.get_running_loop()
             
-            for service in services_to_scan:
+            async def scan_service(service: str):
+                self.logger.info(f"Scanning {service}...")
                 try:
-                    self.logger.info(f"Scanning {service}...")
-                    scan_method = getattr(self.scanner, f'scan_{service}')
-                    current_scan[service] = scan_method()
-                    
-                    # Broadcast service-specific results immediately
-                    await self.broadcast({
-                        'type': 'service_scan_complete',
-                        'service': service,
-                        'data': current_scan[service],
-                        'timestamp': datetime.utcnow().isoformat()
-                    })
-                    
+                    return service, await loop.run_in_executor(None, self.scanner.scan_service, service)
                 except Exception as e:
                     self.logger.error(f"Error scanning {service}: {str(e)}")
+                    return service, None
+            
+            for next_scan in asyncio.as_completed([scan_service(service) for service in services_to_scan]):
+                service, results = await next_scan
+                if results is None:
                     current_scan[service] = []
+                    continue
+                
+                current_scan[service] = results
+                
+                # Broadcast service-specific results immediately
+                await self.broadcast({
+                    'type': 'service_scan_complete',
+                    'service': service,
+                    'data': results,
+                    'timestamp': scan_ts_iso
+                })
             
             # Compare with previous results
-            changes = self._compare_scans(current_scan)
+            current_fingerprints = {
+                service: {r['resource_id']: _fingerprint(r) for r in results}
+                for service, results in current_scan.items()
+            }
+            changes = self._compare_scans(current_scan, current_fingerprints)
             
             # Update last scan results
             self.last_scan_results = current_scan
+            self.last_fingerprints = current_fingerprints
             
             # Calculate scan duration
-            scan_duration = (datetime.utcnow() - scan_start).total_seconds()
+            scan_duration = (datetime.now(timezone.utc) - scan_start).total_seconds()
             self.logger.info(f"Scan completed in {scan_duration:.2f} seconds")
             
             if changes:
                 change_summary = {
                     'type': 'changes_detected',
-                    'timestamp': datetime.utcnow().isoformat(),
+                    'timestamp': scan_ts_iso,
                     'scan_duration': scan_duration,
                     'changes': changes
                 }
                 await self.broadcast(change_summary)
+                self._enqueue_notification(changes, scan_start)
                 return change_summary
             
             return None
@@ -107,8 +152,63 @@ class CloudMonitor:
             self.logger.error(f"Error during scan and compare: {str(e)}")
             raise
     
-    def _compare_scans(self, current_scan: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
-        """Compare current scan with previous results"""
+    def _enqueue_notification(self, changes: Dict[str, Any], ts: Optional[datetime] = None):
+        """Queue detected changes for the notification worker without blocking the scan"""
+        if self._notify_queue is None:
+            return
+        try:
+            self._notify_queue.put_nowait((self._changes_to_notifications(changes), ts))
+        except asyncio.QueueFull:
+            self.logger.warning("Notification queue is full, dropping change notification")
+    
+    async def _notify_worker(self):
+        """Send queued change notifications off the scan loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            notifications, ts = await self._notify_queue.get()
+            try:
+                await loop.run_in_executor(None, partial(
+                    self.notifier.notify_changes, notifications, self.notifier.notification_type, ts=ts
+                ))
+            except Exception as e:
+                self.logger.error(f"Error sending change notification: {str(e)}")
+            finally:
+                self._notify_queue.task_done()
+    
+    @staticmethod
+    def _changes_to_notifications(changes: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Convert _compare_scans output into the change list NotificationService.notify_changes expects"""
+        notifications = []
+        for service, service_changes in changes.items():
+            for resource in service_changes['new_issues']:
+                notifications.append({
+                    'type': 'new_resource',
+                    'service': service,
+                    'resource_id': resource['resource_id'],
+                    'issues': len(resource.get('misconfigurations', []))
+                })
+            for resource in service_changes['resolved_issues']:
+                notifications.append({
+                    'type': 'removed_resource',
+                    'service': service,
+                    'resource_id': resource['resource_id'],
+                    'issues': len(resource.get('misconfigurations', []))
+                })
+            for change in service_changes['changed_issues']:
+                delta = (len(change['current'].get('misconfigurations', [])) -
+                         len(change['previous'].get('misconfigurations', [])))
+                if delta:
+                    notifications.append({
+                        'type': 'new_issues' if delta > 0 else 'resolved_issues',
+                        'service': service,
+                        'resource_id': change['resource_id'],
+                        'issues': abs(delta)
+                    })
+        return notifications
+    
+    def _compare_scans(self, current_scan: Dict[str, List[Dict[str, Any]]],
+                       current_fingerprints: Dict[str, Dict[str, bytes]]) -> Dict[str, Any]:
+        """Compare current scan with previous results using per-resource fingerprints"""
         if not self.last_scan_results:
             return {}
             
@@ -116,38 +216,37 @@ class CloudMonitor:
         for service, results in current_scan.items():
             previous_results = self.last_scan_results.get(service, [])
             
-            # Compare current and previous results
-            new_issues = []
-            resolved_issues = []
-            changed_issues = []
+            current_fps = current_fingerprints.get(service, {})
+            previous_fps = self.last_fingerprints.get(service, {})
             
-            current_resources = {r['resource_id']: r for r in results}
-            previous_resources = {r['resource_id']: r for r in previous_results}
-            
-            # Find new and changed issues
-            for resource_id, current in current_resources.items():
-                if resource_id not in previous_resources:
-                    new_issues.append(current)
-                else:
-                    prev = previous_resources[resource_id]
-                    if current != prev:
-                        changed_issues.append({
-                            'resource_id': resource_id,
-                            'previous': prev,
-                            'current': current
-                        })
-            
-            # Find resolved issues
-            for resource_id, prev in previous_resources.items():
-                if resource_id not in current_resources:
-                    resolved_issues.append(prev)
+            # Set algebra over the fingerprint keys; full resources are only looked up for the diffs
+            new_ids = current_fps.keys() - previous_fps.keys()
+            resolved_ids = previous_fps.keys() - current_fps.keys()
+            changed_ids = {
+                rid for rid in current_fps.keys() & previous_fps.keys()
+                if current_fps[rid] != previous_fps[rid]
+            }
+            if not (new_ids or resolved_ids or changed_ids):
+                continue
             
-            if new_issues or resolved_issues or changed_issues:
-                changes[service] = {
-                    'new_issues': new_issues,
-                    'resolved_issues': resolved_issues,
-                    'changed_issues': changed_issues
+            # Walk the scans themselves so the change lists keep scan order
+            previous_resources = {r['resource_id']: r for r in previous_results}
+            new_issues = [r for r in results if r['resource_id'] in new_ids]
+            resolved_issues = [r for r in previous_results if r['resource_id'] in resolved_ids]
+            changed_issues = [
+                {
+                    'resource_id': r['resource_id'],
+                    'previous': previous_resources[r['resource_id']],
+                    'current': r
                 }
+                for r in results if r['resource_id'] in changed_ids
+            ]
+            
+            changes[service] = {
+                'new_issues': new_issues,
+                'resolved_issues': resolved_issues,
+                'changed_issues': changed_issues
+            }
         
         return changes
     
@@ -159,6 +258,10 @@ class CloudMonitor:
         self.logger.info("Starting monitoring process...")
         self.is_running = True
         
+        if self.notifier and self._notify_task is None:
+            self._notify_queue = asyncio.Queue(maxsize=self.NOTIFY_QUEUE_SIZE)
+            self._notify_task = asyncio.create_task(self._notify_worker())
+        
         # Perform initial scan
         try:
             initial_scan = await self.scan_and_compare()
@@ -185,4 +288,8 @@ class CloudMonitor:
         self.is_running = False
         if self.current_scan_task:
             self.current_scan_task.cancel()
+        if self._notify_task:
+            self._notify_task.cancel()
+            self._notify_task = None
+            self._notify_queue = None
         self.logger.info("Monitoring process stopped")
@@ -2,11 +2,13 @@ from typing import Dict, List, Any
 import boto3
 import logging
 from datetime import datetime
+from .aws_config import BOTO_CONFIG
 
 class NetworkScanner:
     def __init__(self, session: boto3.Session):
         self.session = session
-        self.ec2_client = session.client('ec2')
+        self.ec2_client = session.client('ec2', config=BOTO_CONFIG)
+        self._nacl_paginator = self.ec2_client.get_paginator('describe_network_acls')
         self.risk_weights = {
             'open_ports': 10.0,
             'unrestricted_access': 8.0,
@@ -18,28 +20,35 @@ class NetworkScanner:
     def scan_network_acls(self) -> List[Dict[str, Any]]:
         """Scan Network ACLs for security misconfigurations"""
         try:
-            response = self.ec2_client.describe_network_acls()
             results = []
+            pages = self._nacl_paginator.paginate(PaginationConfig={'PageSize': 100})
 
-            for nacl in response['NetworkAcls']:
+            for nacl in (nacl for page in pages for nacl in page['NetworkAcls']):
                 misconfigurations = []
                 nacl_id = nacl['NetworkAclId']
                 vpc_id = nacl['VpcId']
 
-                # Check for unrestricted inbound access
+                # Single pass over the entries, collecting flags for each check
+                has_egress_rules = False
+                unrestricted_inbound = False
+                allows_all_protocols = False
                 for entry in nacl['Entries']:
-                    if entry['Egress'] is False:  # Inbound rule
-                        if (entry['CidrBlock'] == '0.0.0.0/0' and 
-                            entry['RuleAction'] == 'allow' and 
-                            entry['Protocol'] == '-1'):  # All traffic
-                            misconfigurations.append({
-                                'type': 'unrestricted_access',
-                                'severity': 'HIGH',
-                                'description': f'Network ACL {nacl_id} allows unrestricted inbound access'
-                            })
+                    egress = entry['Egress']
+                    has_egress_rules |= egress
+                    if entry['Protocol'] == '-1' and entry['RuleAction'] == 'allow':  # All traffic
+                        allows_all_protocols = True
+                        if not egress and entry['CidrBlock'] == '0.0.0.0/0':
+                            unrestricted_inbound = True
+
+                # Check for unrestricted inbound access
+                if unrestricted_inbound:
+                    misconfigurations.append({
+                        'type': 'unrestricted_access',
+                        'severity': 'HIGH',
+                        'description': f'Network ACL {nacl_id} allows unrestricted inbound access'
+                    })
 
                 # Check for missing egress rules
-                has_egress_rules = any(entry['Egress'] for entry in nacl['Entries'])
                 if not has_egress_rules:
                     misconfigurations.append({
                         'type': 'no_egress_rules',
@@ -48,14 +57,12 @@ class NetworkScanner:
                     })
 
                 # Check for insecure protocols (e.g., allowing all ports)
-                for entry in nacl['Entries']:
-                    if (entry['Protocol'] == '-1' and 
-                        entry['RuleAction'] == 'allow'):
-                        misconfigurations.append({
-                            'type': 'insecure_protocol',
-                            'severity': 'MEDIUM',
-                            'description': f'Network ACL {nacl_id} allows all protocols'
-                        })
+                if allows_all_protocols:
+                    misconfigurations.append({
+                        'type': 'insecure_protocol',
+                        'severity': 'MEDIUM',
+                        'description': f'Network ACL {nacl_id} allows all protocols'
+                    })
 
                 # Check for tags
                 if 'Tags' not in nacl or not nacl['Tags']:
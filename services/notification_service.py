@@ -1,8 +1,39 @@
-from typing import Dict, Any, List, Optional
-import requests
+from typing import Dict, Any, List, Optional, Tuple
 import json
 import logging
+import os
 from datetime import datetime
+from collections import Counter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SERVICES = ("s3", "ec2", "iam", "rds", "network")
+
+# requests is imported on first send so runs without webhooks never load it
+_requests = None
+
+def _get_requests():
+    """Import and cache the requests module"""
+    global _requests
+    if _requests is None:
+        import requests
+        _requests = requests
+    return _requests
+
+_JSON_HEADERS = {'Content-Type': 'application/json'}
+
+def _format_ts(ts: Optional[datetime] = None) -> str:
+    """Format a notification time as local time labelled with its zone; naive values are taken as local"""
+    return (ts or datetime.now()).astimezone().strftime('%Y-%m-%d %H:%M:%S %Z')
+
+def _encode_payload(payload: Dict[str, Any]) -> bytes:
+    """Serialize a webhook payload to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=str)
+    return json.dumps(payload, default=str).encode('utf-8')
 
 class NotificationService:
     def __init__(self, slack_webhook_url: Optional[str] = None, teams_webhook_url: Optional[str] = None):
@@ -10,6 +41,51 @@ class NotificationService:
         self.slack_webhook_url = slack_webhook_url
         self.teams_webhook_url = teams_webhook_url
         self.logger = logging.getLogger(__name__)
+        
+        self._session = None
+
+    @classmethod
+    def from_env(cls) -> Optional["NotificationService"]:
+        """Build a service from SLACK_WEBHOOK_URL / TEAMS_WEBHOOK_URL, or None if neither is set"""
+        slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
+        teams_webhook_url = os.getenv("TEAMS_WEBHOOK_URL")
+        if not (slack_webhook_url or teams_webhook_url):
+            return None
+        return cls(slack_webhook_url, teams_webhook_url)
+
+    @property
+    def notification_type(self) -> str:
+        """The notification_type covering just the platforms with a configured webhook"""
+        if self.slack_webhook_url and self.teams_webhook_url:
+            return "both"
+        return "slack" if self.slack_webhook_url else "teams"
+
+    def _get_session(self):
+        """Create the pooled HTTP session on first use"""
+        if self._session is None:
+            requests = _get_requests()
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            
+            # Reuse HTTPS connections to the webhook hosts across notifications
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=8,
+                # Webhook POSTs are not idempotent: a 5xx may come after the message was
+                # delivered, so only retry rate limiting and failed connections
+                max_retries=Retry(
+                    total=2,
+                    read=0,
+                    backoff_factor=0.2,
+                    status_forcelist=[429],
+                    allowed_methods=frozenset(['POST']),
+                    respect_retry_after_header=True
+                )
+            )
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
 
     def send_slack_notification(self, message: Dict[str, Any]) -> bool:
         """Send notification to Slack"""
@@ -18,10 +94,11 @@ class NotificationService:
             return False
 
         try:
-            response = requests.post(
+            response = self._get_session().post(
                 self.slack_webhook_url,
-                json=message,
-                headers={'Content-Type': 'application/json'}
+                data=_encode_payload(message),
+                headers=_JSON_HEADERS,
+                timeout=(3, 10)
             )
             response.raise_for_status()
             return True
@@ -45,7 +122,7 @@ class NotificationService:
                 "sections": [
                     {
                         "activityTitle": message.get("title", "AWS Scan Results"),
-                        "activitySubtitle": message.get("subtitle", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+                        "activitySubtitle": message.get("subtitle", _format_ts()),
                         "facts": [
                             {"name": k, "value": v}
                             for k, v in message.get("fields", {}).items()
@@ -55,10 +132,11 @@ class NotificationService:
                 ]
             }
 
-            response = requests.post(
+            response = self._get_session().post(
                 self.teams_webhook_url,
-                json=teams_message,
-                headers={'Content-Type': 'application/json'}
+                data=_encode_payload(teams_message),
+                headers=_JSON_HEADERS,
+                timeout=(3, 10)
             )
             response.raise_for_status()
             return True
@@ -66,38 +144,28 @@ class NotificationService:
             self.logger.error(f"Failed to send Teams notification: {str(e)}")
             return False
 
-    def notify_scan_results(self, scan_results: Dict[str, Any], notification_type: str = "both") -> bool:
+    def notify_scan_results(self, scan_results: Dict[str, Any], notification_type: str = "both",
+                            ts: Optional[datetime] = None) -> bool:
         """Send scan results notification to configured platforms"""
         success = True
         
         # Calculate summary statistics
-        total_issues = sum(
-            len(resource.get("misconfigurations", []))
-            for service in ["s3", "ec2", "iam", "rds", "network"]
-            for resource in scan_results.get(service, [])
-        )
-        
-        high_severity = sum(
-            1 for service in ["s3", "ec2", "iam", "rds", "network"]
-            for resource in scan_results.get(service, [])
-            for issue in resource.get("misconfigurations", [])
-            if issue.get("severity") == "HIGH"
-        )
+        total_issues, high_severity = self._count_issues(scan_results)
         
         # Get compliance scores
         compliance_scores = {}
-        if "compliance" in scan_results:
-            for framework in ["cis", "nist", "pci"]:
-                if framework in scan_results["compliance"]:
-                    controls = scan_results["compliance"][framework]["controls"]
-                    total = len(controls)
-                    passed = len([c for c in controls if c["status"] == "PASS"])
-                    compliance_scores[framework.upper()] = f"{(passed/total*100):.1f}%" if total > 0 else "N/A"
+        for framework in ["cis", "nist", "pci"]:
+            if framework not in scan_results.get("compliance", {}):
+                continue
+            controls = scan_results["compliance"][framework]["controls"]
+            total = len(controls)
+            passed = sum(1 for c in controls if c["status"] == "PASS")
+            compliance_scores[framework.upper()] = f"{(passed/total*100):.1f}%" if total > 0 else "N/A"
 
         # Prepare message for both platforms
         message = {
             "title": "AWS Security Scan Results",
-            "subtitle": f"Scan completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            "subtitle": f"Scan completed at {_format_ts(ts)}",
             "summary": "AWS Security Scan Results",
             "fields": {
                 "Total Issues": total_issues,
@@ -138,7 +206,8 @@ class NotificationService:
 
         return success
 
-    def notify_changes(self, changes: List[Dict[str, Any]], notification_type: str = "both") -> bool:
+    def notify_changes(self, changes: List[Dict[str, Any]], notification_type: str = "both",
+                       ts: Optional[datetime] = None) -> bool:
         """Send notification about detected changes"""
         if not changes:
             return True
@@ -162,7 +231,7 @@ class NotificationService:
         # Prepare message
         message = {
             "title": "AWS Security Changes Detected",
-            "subtitle": f"Changes as of {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            "subtitle": f"Changes as of {_format_ts(ts)}",
             "summary": "AWS Security Changes",
             "fields": {
                 "New Resources": "\n".join(changes_summary["new_resource"]) or "None",
@@ -205,3 +274,14 @@ class NotificationService:
                 success = False
 
         return success
+
+    def _count_issues(self, scan_results: Dict[str, Any]) -> Tuple[int, int]:
+        """Count total and high severity misconfigurations across services in one pass"""
+        severities = Counter()
+        total_issues = 0
+        for service in SERVICES:
+            for resource in scan_results.get(service, ()):
+                misconfigurations = resource.get("misconfigurations", ())
+                total_issues += len(misconfigurations)
+                severities.update(issue.get("severity") for issue in misconfigurations)
+        return total_issues, severities["HIGH"]
@@ -1,91 +1,371 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+import bisect
 import boto3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
+import gzip
 import json
 import logging
+import numpy as np
+import pandas as pd
 import os
+import threading
+import time
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Services with a per-service trend series
+_SERVICES = ('ec2', 'rds', 's3', 'iam', 'network')
+
+@lru_cache(maxsize=4096)
+def _parse_iso(timestamp: str) -> datetime:
+    """Parse an ISO timestamp, memoized since the same scan timestamps are parsed on load and compaction"""
+    return datetime.fromisoformat(timestamp)
+
+class _DateTimeEncoder(json.JSONEncoder):
+    """JSON encoder that writes datetime values as ISO format strings"""
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+def _dumps(data: Dict[str, Any]) -> bytes:
+    """Serialize a history entry to compact single-line JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, separators=(',', ':'), cls=_DateTimeEncoder).encode('utf-8')
+
+def _loads(data: bytes) -> Dict[str, Any]:
+    """Parse a history entry from JSON bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Raised when reading a gzip log whose last member was cut off mid-append
+_GZIP_ERRORS = (EOFError, gzip.BadGzipFile, zlib.error)
 
 class TrendAnalyzer:
-    def __init__(self):
-        self.data_dir = "data/history"
-        os.makedirs(self.data_dir, exist_ok=True)
-        self.scan_results = self._load_historical_data()
+    # Read/write buffer for history files so large scans move in few syscalls
+    IO_BUFFER_SIZE = 64 * 1024
+    # Upper bound on threads used to load the history directory
+    LOAD_WORKERS = 16
+    # Minimum seconds between background cleanups of the history directory
+    CLEANUP_INTERVAL = 3600
+    # Append-only gzip scan log, one JSON entry per line and one gzip member per append
+    HISTORY_LOG = "scans.ndjson.gz"
+    # Uncompressed scan log from earlier releases, still read and compacted
+    LEGACY_HISTORY_LOG = "scans.ndjson"
+    # Low gzip level keeps most of the ratio on repetitive scan JSON at little CPU cost
+    COMPRESS_LEVEL = 3
+    # Days of history kept on disk
+    RETENTION_DAYS = 90
+
+    def __init__(self, data_dir: Optional[str] = "data/history"):
+        """Initialize the analyzer; a data_dir of None keeps history in memory only"""
+        self.data_dir = data_dir
+        # Serializes appends with the background log compaction
+        self._log_lock = threading.Lock()
+        # Guards the in-memory history, which compaction prunes from the cleanup thread
+        self._index_lock = threading.Lock()
+        if data_dir is None:
+            self._log_path = self._legacy_log_path = None
+            self.scan_results = []
+        else:
+            os.makedirs(self.data_dir, exist_ok=True)
+            self._log_path = os.path.join(self.data_dir, self.HISTORY_LOG)
+            self._legacy_log_path = os.path.join(self.data_dir, self.LEGACY_HISTORY_LOG)
+            self.scan_results = self._load_historical_data()
+        
+        # Keep history ordered by scan time so date ranges are found by bisection
+        self.scan_results.sort(key=lambda result: result['_dt'])
+        self._sorted_dts = [result['_dt'] for result in self.scan_results]
+        
+        # Per-day scan counts and per-service issue totals, maintained as scans arrive
+        self._daily_agg: Dict[str, Dict[str, Any]] = {}
+        self._daily_dates: List[str] = []
+        for result in self.scan_results:
+            self._aggregate_entry(result)
+        
+        # Trend results keyed by (days, history size, day); cleared whenever a scan is stored
+        self._trend_cache: Dict[Tuple[int, int, str], Dict[str, Any]] = {}
+        self._last_cleanup_ts: Optional[float] = None
+        self._last_cleanup_mtime: Optional[float] = None
+        self._oldest_file_ctime = float('inf')
 
     def _load_historical_data(self) -> List[Dict[str, Any]]:
-        """Load historical scan data from files"""
+        """Load historical scan data from the scan log and legacy per-scan files"""
         try:
-            results = []
-            for filename in os.listdir(self.data_dir):
-                if filename.endswith('.json'):
-                    with open(os.path.join(self.data_dir, filename), 'r') as f:
-                        results.append(json.load(f))
+            results = list(self._iter_log_entries())
+            
+            # Per-scan JSON files written before the scan log existed
+            with os.scandir(self.data_dir) as entries:
+                paths = [entry.path for entry in entries if entry.name.endswith('.json') and entry.is_file()]
+            if paths:
+                # Overlap file reads across threads; parse order does not matter
+                with ThreadPoolExecutor(max_workers=min(self.LOAD_WORKERS, len(paths))) as executor:
+                    results.extend(entry for entry in executor.map(self._load_history_file, paths) if entry is not None)
             logging.info(f"Loaded {len(results)} historical scan results")
             return results
         except Exception as e:
             logging.error(f"Error loading historical data: {str(e)}")
             return []
 
+    def _open_log(self, path: str, mode: str):
+        """Open a scan log, transparently compressing the gzip log"""
+        if path.endswith('.gz'):
+            return gzip.open(path, mode, compresslevel=self.COMPRESS_LEVEL)
+        return open(path, mode, buffering=self.IO_BUFFER_SIZE)
+
+    def _iter_log_entries(self):
+        """Stream indexed entries from the scan logs one line at a time"""
+        for path in (self._legacy_log_path, self._log_path):
+            try:
+                log = self._open_log(path, 'rb')
+            except FileNotFoundError:
+                continue
+            line_number = 0
+            damaged = False
+            with log:
+                try:
+                    for line_number, line in enumerate(log, 1):
+                        if not line.strip():
+                            continue
+                        # A corrupt line only loses that scan, not the rest of the history
+                        try:
+                            yield self._index_entry(_loads(line))
+                        except Exception as e:
+                            logging.warning(f"Skipping unreadable line {line_number} of {path}: {str(e)}")
+                except _GZIP_ERRORS as e:
+                    # A truncated final member keeps the entries read before it
+                    logging.warning(f"Scan log {path} is damaged after line {line_number}: {str(e)}")
+                    damaged = True
+            if damaged:
+                self._repair_log(path)
+
+    def _repair_log(self, path: str):
+        """Quarantine a damaged scan log and put its readable entries back in its place"""
+        tmp_path = f"{path}.tmp{os.path.splitext(path)[1]}"
+        quarantine_path = f"{path}.corrupt-{int(time.time())}"
+        try:
+            with self._log_lock:
+                kept = 0
+                with self._open_log(tmp_path, 'wb') as target:
+                    try:
+                        with self._open_log(path, 'rb') as source:
+                            for line in source:
+                                # A partial line at the break would swallow the next append
+                                if line.endswith(b'\n'):
+                                    target.write(line)
+                                    kept += 1
+                    except _GZIP_ERRORS:
+                        pass
+                os.replace(path, quarantine_path)
+                os.replace(tmp_path, path)
+            logging.warning(f"Moved damaged scan log to {quarantine_path}, kept {kept} entries")
+        except Exception as e:
+            logging.error(f"Error repairing scan log {path}: {str(e)}")
+
+    def _load_history_file(self, path: str) -> Optional[Dict[str, Any]]:
+        """Read and index a single scan history file, returning None if it is unreadable"""
+        try:
+            with open(path, 'rb', buffering=self.IO_BUFFER_SIZE) as f:
+                return self._index_entry(_loads(f.read()))
+        except Exception as e:
+            logging.warning(f"Skipping unreadable history file {path}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _index_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalize the results and attach the parsed timestamp, date string and per-service issue counts"""
+        # Validate the shape once here: only service resource lists and compliance data are kept
+        entry['results'] = {
+            service: resources for service, resources in entry['results'].items()
+            if service == 'compliance' or isinstance(resources, list)
+        }
+        entry['_dt'] = _parse_iso(entry['timestamp'])
+        entry['_date_str'] = entry['_dt'].date().isoformat()
+        entry['_service_issues'] = Counter({
+            service: sum(len(resource.get('misconfigurations') or ()) for resource in resources)
+            for service, resources in entry['results'].items()
+            if service != 'compliance'
+        })
+        return entry
+
+    def _aggregate_entry(self, entry: Dict[str, Any]):
+        """Fold an entry's per-service issue counts into its day's running totals"""
+        day = entry['_date_str']
+        bucket = self._daily_agg.get(day)
+        if bucket is None:
+            bucket = self._daily_agg[day] = {'scans': 0, 'issues': Counter()}
+            bisect.insort(self._daily_dates, day)
+        bucket['scans'] += 1
+        # Counter.update adds counts in C rather than looping over services in Python
+        bucket['issues'].update(entry['_service_issues'])
+
+    def _unaggregate_entry(self, entry: Dict[str, Any]):
+        """Take an expired entry back out of its day's running totals"""
+        day = entry['_date_str']
+        bucket = self._daily_agg[day]
+        bucket['scans'] -= 1
+        if bucket['scans']:
+            bucket['issues'].subtract(entry['_service_issues'])
+            return
+        del self._daily_agg[day]
+        del self._daily_dates[bisect.bisect_left(self._daily_dates, day)]
+
     def store_scan_results(self, results: Dict[str, Any]):
         """Store scan results with timestamp"""
         try:
-            # Convert any datetime objects to ISO format strings
-            def convert_dates(obj):
-                if isinstance(obj, dict):
-                    return {k: convert_dates(v) for k, v in obj.items()}
-                elif isinstance(obj, list):
-                    return [convert_dates(item) for item in obj]
-                elif isinstance(obj, datetime):
-                    return obj.isoformat()
-                return obj
-
-            processed_results = convert_dates(results)
             timestamp = datetime.utcnow().isoformat()
             
-            # Store in memory
-            self.scan_results.append({
+            # Store in memory, keeping the history sorted by scan time
+            entry = self._index_entry({
                 'timestamp': timestamp,
-                'results': processed_results
+                'results': results
             })
+            with self._index_lock:
+                index = bisect.bisect_right(self._sorted_dts, entry['_dt'])
+                self._sorted_dts.insert(index, entry['_dt'])
+                self.scan_results.insert(index, entry)
+                self._aggregate_entry(entry)
+                self._trend_cache.clear()
+            
+            if self.data_dir is None:
+                return
             
-            # Store on disk
-            filename = f"scan_{timestamp.replace(':', '-')}.json"
-            with open(os.path.join(self.data_dir, filename), 'w') as f:
-                json.dump({
-                    'timestamp': timestamp,
-                    'results': processed_results
-                }, f, indent=2)
+            # Append to the scan log on disk
+            line = _dumps({
+                'timestamp': timestamp,
+                'results': entry['results']
+            }) + b'\n'
+            with self._log_lock, self._open_log(self._log_path, 'ab') as f:
+                f.write(line)
             
-            logging.info(f"Successfully stored scan results: {filename}")
+            logging.info(f"Successfully stored scan results: {timestamp}")
             
-            # Clean up old files (keep last 90 days)
-            self._cleanup_old_files()
+            # Clean up old history off the store path, at most once per interval
+            now = time.monotonic()
+            if self._last_cleanup_ts is None or now - self._last_cleanup_ts > self.CLEANUP_INTERVAL:
+                self._last_cleanup_ts = now
+                threading.Thread(target=self._cleanup_old_files, name='trend-history-cleanup', daemon=True).start()
             
         except Exception as e:
             logging.error(f"Error storing scan results: {str(e)}")
 
     def _cleanup_old_files(self):
-        """Remove scan files older than 90 days"""
+        """Remove legacy scan files and scan log entries older than the retention period"""
         try:
-            cutoff = datetime.utcnow() - timedelta(days=90)
-            for filename in os.listdir(self.data_dir):
-                if not filename.endswith('.json'):
-                    continue
+            retention = timedelta(days=self.RETENTION_DAYS)
+            self._compact_log(datetime.utcnow() - retention)
+            
+            cutoff_ts = time.time() - retention.total_seconds()
+            
+            # Nothing to scan if no file was added or removed since the last pass and
+            # the oldest file left by that pass is still within the retention period
+            if (os.stat(self.data_dir).st_mtime == self._last_cleanup_mtime
+                    and self._oldest_file_ctime >= cutoff_ts):
+                return
+            
+            oldest_ctime = float('inf')
+            with os.scandir(self.data_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.json') or not entry.is_file(follow_symlinks=False):
+                        continue
                     
-                filepath = os.path.join(self.data_dir, filename)
-                file_time = datetime.fromtimestamp(os.path.getctime(filepath))
-                
-                if file_time < cutoff:
-                    os.remove(filepath)
-                    logging.info(f"Removed old scan file: {filename}")
+                    # DirEntry caches the stat result, so this is one syscall per file
+                    ctime = entry.stat().st_ctime
+                    if ctime >= cutoff_ts:
+                        oldest_ctime = min(oldest_ctime, ctime)
+                        continue
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    logging.info(f"Removed old scan file: {entry.name}")
+            
+            # Re-read after our own deletions so they do not count as a change next time
+            self._last_cleanup_mtime = os.stat(self.data_dir).st_mtime
+            self._oldest_file_ctime = oldest_ctime
         except Exception as e:
             logging.error(f"Error cleaning up old files: {str(e)}")
 
+    def _compact_log(self, cutoff: datetime):
+        """Rewrite the scan log in one pass without entries older than the cutoff"""
+        # History is sorted, so nothing to drop unless the oldest entry is past the cutoff
+        if not self._sorted_dts or self._sorted_dts[0] >= cutoff:
+            return
+        
+        with self._log_lock:
+            # Drop expired entries from memory too, so the check above passes until more expire
+            with self._index_lock:
+                expired = bisect.bisect_left(self._sorted_dts, cutoff)
+                for entry in self.scan_results[:expired]:
+                    self._unaggregate_entry(entry)
+                del self.scan_results[:expired]
+                del self._sorted_dts[:expired]
+                self._trend_cache.clear()
+            
+            for path in (self._legacy_log_path, self._log_path):
+                self._compact_log_file(path, cutoff)
+
+    def _compact_log_file(self, path: str, cutoff: datetime):
+        """Rewrite one scan log without expired entries; the caller holds the log lock"""
+        try:
+            source = self._open_log(path, 'rb')
+        except FileNotFoundError:
+            return
+        
+        # Same suffix as the source so the temporary file gets the same compression
+        tmp_path = f"{path}.tmp{os.path.splitext(path)[1]}"
+        dropped = 0
+        with source, self._open_log(tmp_path, 'wb') as target:
+            for line in source:
+                if not line.strip():
+                    continue
+                try:
+                    expired = _parse_iso(_loads(line)['timestamp']) < cutoff
+                except Exception:
+                    # Leave lines the loader skips untouched rather than guessing their age
+                    expired = False
+                if expired:
+                    dropped += 1
+                    continue
+                target.write(line)
+        
+        if dropped:
+            os.replace(tmp_path, path)
+            logging.info(f"Removed {dropped} expired entries from {path}")
+        else:
+            os.unlink(tmp_path)
+
+    @staticmethod
+    def _copy_trends(trends: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a cached trend result so callers cannot mutate the cache"""
+        return {
+            'overall': [dict(point) for point in trends['overall']],
+            'services': {
+                service: [dict(point) for point in points]
+                for service, points in trends['services'].items()
+            }
+        }
+
     def get_historical_trends(self, days: int = 30) -> Dict[str, Any]:
         """Get historical trends for the specified number of days"""
         try:
             end_date = datetime.utcnow()
             start_date = end_date - timedelta(days=days)
             
+            cache_key = (days, len(self.scan_results), end_date.date().isoformat())
+            cached = self._trend_cache.get(cache_key)
+            if cached is not None:
+                return self._copy_trends(cached)
+            
             logging.info(f"Getting trends from {start_date} to {end_date}")
             logging.info(f"Current scan results: {len(self.scan_results)} entries")
             
@@ -97,70 +377,57 @@ class TrendAnalyzer:
                 }
                 return {
                     'overall': [current_scan],
-                    'services': {
-                        'ec2': [current_scan],
-                        'rds': [current_scan],
-                        's3': [current_scan],
-                        'iam': [current_scan],
-                        'network': [current_scan]
-                    }
+                    'services': {service: [current_scan] for service in _SERVICES}
                 }
             
-            # Filter results within the date range
-            filtered_results = [
-                result for result in self.scan_results
-                if start_date <= datetime.fromisoformat(result['timestamp']) <= end_date
+            # Select the pre-aggregated days within the date range
+            with self._index_lock:
+                lo = bisect.bisect_left(self._daily_dates, start_date.date().isoformat())
+                hi = bisect.bisect_right(self._daily_dates, end_date.date().isoformat())
+                dates = self._daily_dates[lo:hi]
+                buckets = [self._daily_agg[date] for date in dates]
+            
+            # Average issues per scan for each day, as a day x service matrix
+            rows = [
+                (index, service, count)
+                for index, bucket in enumerate(buckets)
+                for service, count in bucket['issues'].items()
             ]
+            issues = (
+                pd.DataFrame(rows, columns=['day', 'service', 'issues'])
+                .groupby(['day', 'service'])['issues'].sum()
+                .unstack(fill_value=0)
+                .reindex(index=range(len(buckets)), fill_value=0)
+                .div(np.array([bucket['scans'] for bucket in buckets]), axis=0)
+            )
+            service_issues = issues.reindex(columns=list(_SERVICES), fill_value=0)
             
-            # Calculate scores for each service
-            service_scores = {}
-            overall_scores = []
-            
-            for result in filtered_results:
-                date = datetime.fromisoformat(result['timestamp']).date().isoformat()
-                
-                # Count issues per service
-                service_issues = {}
-                total_issues = 0
-                
-                for service, resources in result['results'].items():
-                    if service == 'compliance' or not isinstance(resources, list):
-                        continue
-                    
-                    issues = sum(len(resource.get('misconfigurations', [])) for resource in resources)
-                    service_issues[service] = issues
-                    total_issues += issues
-                
-                # Calculate scores (100 - deductions)
-                overall_score = max(0, 100 - (total_issues * 2))
-                overall_scores.append({
-                    'date': date,
-                    'value': overall_score
-                })
-                
-                for service in ['ec2', 'rds', 's3', 'iam', 'network']:
-                    if service not in service_scores:
-                        service_scores[service] = []
-                    
-                    score = max(0, 100 - (service_issues.get(service, 0) * 5))
-                    service_scores[service].append({
-                        'date': date,
-                        'value': score
-                    })
+            # Calculate scores (100 - deductions); days are already in date order
+            overall_values = np.rint(np.clip(100 - issues.sum(axis=1).to_numpy() * 2, 0, 100)).astype(int)
+            service_values = np.rint(np.clip(100 - service_issues.to_numpy() * 5, 0, 100)).astype(int)
             
-            # Sort all scores by date
-            overall_scores.sort(key=lambda x: x['date'])
-            for service in service_scores:
-                service_scores[service].sort(key=lambda x: x['date'])
+            overall_scores = [
+                {'date': date, 'value': value}
+                for date, value in zip(dates, overall_values.tolist())
+            ]
+            service_scores = {
+                service: [
+                    {'date': date, 'value': value}
+                    for date, value in zip(dates, values)
+                ]
+                for service, values in zip(_SERVICES, service_values.T.tolist())
+            }
             
             logging.info(f"Generated trends: overall={len(overall_scores)} points")
             for service, scores in service_scores.items():
                 logging.info(f"{service}={len(scores)} points")
             
-            return {
+            trends = {
                 'overall': overall_scores,
                 'services': service_scores
             }
+            self._trend_cache[cache_key] = trends
+            return self._copy_trends(trends)
             
         except Exception as e:
             logging.error(f"Error getting historical trends: {str(e)}")
@@ -168,7 +435,5 @@ class TrendAnalyzer:
             logging.error(traceback.format_exc())
             return {
                 'overall': [],
-                'services': {
-                    'ec2': [], 'rds': [], 's3': [], 'iam': [], 'network': []
-                }
+                'services': {service: [] for service in _SERVICES}
             }
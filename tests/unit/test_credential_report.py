@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime, timedelta, timezone
+from services.compliance_checker import ComplianceChecker
+
+GENERATED_TIME = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+def _report(rows):
+    """Build a credential report CSV with the columns the checks read"""
+    header = 'user,mfa_active,access_key_1_last_rotated,access_key_2_last_rotated'
+    return ('\n'.join([header] + [','.join(row) for row in rows]) + '\n').encode('utf-8')
+
+class TestCredentialReport(unittest.TestCase):
+    def setUp(self):
+        # Every client comes from the mocked session, so iam_client is a MagicMock
+        self.session = MagicMock()
+        self.checker = ComplianceChecker(self.session)
+        self.iam_client = self.checker.iam_client
+        self.iam_client.generate_credential_report.return_value = {'State': 'COMPLETE'}
+
+        old_key = (datetime.now(timezone.utc) - timedelta(days=120)).isoformat()
+        new_key = (datetime.now(timezone.utc) - timedelta(days=10)).isoformat()
+        self.iam_client.get_credential_report.return_value = {
+            'Content': _report([
+                ('<root_account>', 'false', 'not_supported', 'not_supported'),
+                ('alice', 'true', new_key, 'N/A'),
+                ('bob', 'false', old_key, 'N/A'),
+            ]),
+            'GeneratedTime': GENERATED_TIME
+        }
+
+    def test_pci_authentication_skips_root_account(self):
+        """Test that MFA controls cover IAM users only and carry the report time"""
+        controls = self.checker._check_pci_authentication()
+
+        self.assertEqual([c['status'] for c in controls], ['PASS', 'FAIL'])
+        self.assertIn('alice', controls[0]['description'])
+        self.assertIn('bob', controls[1]['description'])
+        for control in controls:
+            self.assertEqual(control['details'], {'credential_report_generated': GENERATED_TIME.isoformat()})
+
+    def test_check_iam_users(self):
+        """Test MFA and key age findings, ignoring keys reported as N/A or not_supported"""
+        results = self.checker.check_iam_users()
+
+        self.assertEqual([r['id'] for r in results], ['PCI.8.3', 'CIS.1.3'])
+        self.assertIn('bob', results[0]['description'])
+        self.assertIn('120 days old', results[1]['description'])
+        self.assertEqual(results[1]['details']['credential_report_generated'], GENERATED_TIME.isoformat())
+
+    def test_report_reused_within_ttl(self):
+        """Test that checks share one report until CREDENTIAL_REPORT_TTL expires"""
+        with patch('services.compliance_checker.time.monotonic', return_value=1000.0):
+            self.checker._check_pci_authentication()
+            self.checker.check_iam_users()
+        self.assertEqual(self.iam_client.get_credential_report.call_count, 1)
+
+        expired = 1000.0 + ComplianceChecker.CREDENTIAL_REPORT_TTL + 1
+        with patch('services.compliance_checker.time.monotonic', return_value=expired):
+            self.checker.check_iam_users()
+        self.assertEqual(self.iam_client.get_credential_report.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -88,6 +88,15 @@ class TestExportHandler(unittest.TestCase):
         self.assertEqual(misconfig_row['Resource ID'], 'test-bucket')
         self.assertEqual(misconfig_row['Severity'], 'HIGH')
 
+    def test_csv_export_malformed_control(self):
+        """Test that a failed CSV export leaves no partial file behind"""
+        del self.sample_data['compliance']['cis']['controls'][0]['control_id']
+        
+        with self.assertRaises(KeyError):
+            self.export_handler.export_csv(self.sample_data, "test_malformed.csv")
+        
+        self.assertEqual(os.listdir(self.test_dir), [])
+
     def test_pdf_export(self):
         """Test PDF export functionality"""
         # Export to PDF
@@ -99,5 +108,13 @@ class TestExportHandler(unittest.TestCase):
         # Verify file size (should be non-zero)
         self.assertGreater(os.path.getsize(pdf_file), 0)
 
+    def test_pdf_export_no_issues(self):
+        """Test PDF export of a scan without issues or compliance data"""
+        pdf_file = self.export_handler.export_pdf({"s3": [{"resource_id": "clean-bucket", "misconfigurations": []}]},
+                                                  "test_empty_export.pdf")
+        
+        self.assertTrue(os.path.exists(pdf_file))
+        self.assertGreater(os.path.getsize(pdf_file), 0)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from services.monitor import CloudMonitor
+
+def _bucket(resource_id, scan_date, issues=()):
+    """Build an s3 scan result the way the scanner reports it"""
+    return {
+        'resource_id': resource_id,
+        'scan_date': scan_date,
+        'misconfigurations': [{'type': issue, 'severity': 'HIGH'} for issue in issues]
+    }
+
+class TestCloudMonitorChanges(unittest.TestCase):
+    def setUp(self):
+        # Keep the monitor off AWS; each test feeds the scans it compares
+        with patch('services.monitor.AWSScanner'):
+            self.monitor = CloudMonitor()
+        self.scans = {}
+        self.monitor.scanner.scan_service.side_effect = lambda service: self.scans.get(service, [])
+
+    def _scan(self, s3_results):
+        """Run one monitor scan with the given s3 results"""
+        self.scans['s3'] = s3_results
+        return asyncio.run(self.monitor.scan_and_compare())
+
+    def test_scan_date_only_is_not_a_change(self):
+        """Test that per-scan timestamps do not count as resource changes"""
+        self._scan([_bucket('bucket-a', '2024-01-01T00:00:00', ['public_access'])])
+        changes = self._scan([_bucket('bucket-a', '2024-01-02T00:00:00', ['public_access'])])
+
+        self.assertIsNone(changes)
+
+    def test_changes_sorted_into_lists_in_scan_order(self):
+        """Test that added, removed and modified resources land in the right list in scan order"""
+        self._scan([
+            _bucket('kept', '1'),
+            _bucket('removed-b', '1'),
+            _bucket('modified-b', '1'),
+            _bucket('removed-a', '1'),
+            _bucket('modified-a', '1'),
+        ])
+        changes = self._scan([
+            _bucket('added-b', '2'),
+            _bucket('modified-b', '2', ['encryption_disabled']),
+            _bucket('kept', '2'),
+            _bucket('modified-a', '2', ['public_access']),
+            _bucket('added-a', '2'),
+        ])['changes']
+
+        self.assertEqual(list(changes), ['s3'])
+        s3 = changes['s3']
+        self.assertEqual([r['resource_id'] for r in s3['new_issues']], ['added-b', 'added-a'])
+        self.assertEqual([r['resource_id'] for r in s3['resolved_issues']], ['removed-b', 'removed-a'])
+        self.assertEqual([c['resource_id'] for c in s3['changed_issues']], ['modified-b', 'modified-a'])
+        self.assertEqual(s3['changed_issues'][0]['previous']['misconfigurations'], [])
+        self.assertEqual(len(s3['changed_issues'][0]['current']['misconfigurations']), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,22 @@
 import asyncio
 import websockets
+import websockets.asyncio.client
 import boto3
-import json
+from services.aws_config import BOTO_CONFIG
+import orjson
 import time
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 import os
 import requests
 import logging
+from typing import Dict, Optional, Set
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional and unavailable on Windows
+    uvloop = None
 
 # Load environment variables
 load_dotenv()
@@ -27,11 +36,45 @@ formatter = logging.Formatter('%(message)s')
 console.setFormatter(formatter)
 logger.addHandler(console)
 
-async def connect_websocket():
-    """Connect to the monitoring WebSocket endpoint"""
+# One session and S3 client shared by resource setup and cleanup, created on first use
+_session = None
+_s3 = None
+
+def get_s3_client():
+    """Return the shared S3 client so setup and cleanup reuse one connection pool"""
+    global _session, _s3
+    if _s3 is None:
+        _session = boto3.Session()
+        _s3 = _session.client('s3', config=BOTO_CONFIG)
+    return _s3
+
+# CloudMonitor.scan_and_compare scans s3, ec2, iam and rds
+MONITORED_SERVICES = frozenset({'s3', 'ec2', 'iam', 'rds'})
+# Upper bound on how long main() waits for a full scan
+MONITOR_TIMEOUT = 60
+
+def parse_scan_timestamp(timestamp: str) -> datetime:
+    """Parse a broadcast scan timestamp, treating naive values as UTC"""
+    scan_start = datetime.fromisoformat(timestamp)
+    if scan_start.tzinfo is None:
+        scan_start = scan_start.replace(tzinfo=timezone.utc)
+    return scan_start
+
+async def request_scan_after_changes(websocket, changes_applied: asyncio.Future):
+    """Send force_scan once the test changes are applied, so a scan that has seen them starts right away"""
+    # Shield so cancelling this task does not cancel the shared future
+    await asyncio.shield(changes_applied)
+    await websocket.send("force_scan")
+
+async def connect_websocket(done: Optional[asyncio.Event] = None,
+                            changes_applied: Optional[asyncio.Future] = None):
+    """Connect to the monitoring WebSocket endpoint, setting done once every service has
+    reported for a scan that started after changes_applied resolved to its completion time"""
     uri = "ws://localhost:8000/api/v1/monitor/ws"
     max_retries = 5
     retry_delay = 3
+    # Services reported so far, keyed by the scan start timestamp shared by that scan's frames
+    services_by_scan: Dict[str, Set[str]] = defaultdict(set)
 
     # Get JWT token
     from generate_token import create_access_token
@@ -42,61 +85,83 @@ async def connect_websocket():
             print(f"\nAttempting WebSocket connection (attempt {attempt + 1}/{max_retries})...")
             headers = {"Authorization": f"Bearer {token}"}
             
-            async with websockets.connect(uri, extra_headers=headers) as websocket:
+            # The asyncio client (websockets >= 14) supports recv(decode=False) below;
+            # scan frames can exceed the 1 MiB default for accounts with many resources
+            async with websockets.asyncio.client.connect(uri, additional_headers=headers,
+                                                         max_size=2 ** 22) as websocket:
                 print("Connected to WebSocket")
                 logger.info("Connected to WebSocket")
                 
-                # Send initial message
-                await websocket.send(json.dumps({"action": "start_monitoring"}))
+                # Send initial message in the single-action form the server parses
+                await websocket.send(orjson.dumps({"action": "start_monitoring"}).decode())
                 
-                while True:
-                    try:
-                        message = await websocket.recv()
-                        data = json.loads(message)
-                        logger.info(f"Received: {data}")
-                        
-                        # Pretty print the received data
-                        print("\nReceived update:")
-                        message_type = data.get('type', 'unknown')
-                        
-                        if message_type == 'service_scan_complete':
-                            service = data.get('service', 'unknown')
-                            scan_data = data.get('data', [])
-                            print(f"Service scan completed: {service}")
-                            print(f"Found {len(scan_data)} resources")
+                # Ask for a scan as soon as the changes are in place instead of waiting out scan_interval
+                force_scan_task = (asyncio.create_task(request_scan_after_changes(websocket, changes_applied))
+                                   if changes_applied is not None else None)
+                try:
+                    while True:
+                        try:
+                            # Take text frames as raw bytes; orjson validates UTF-8 while parsing,
+                            # so websockets does not need to decode them to str first
+                            message = await websocket.recv(decode=False)
+                            data = orjson.loads(message)
+                            # Lazy %-formatting: the payload is only rendered when DEBUG is enabled
+                            logger.debug("Received: %s", data)
                             
-                            # Print misconfigurations if any
-                            for resource in scan_data:
-                                if resource.get('misconfigurations'):
-                                    print(f"Misconfigurations found in {resource['resource_id']}:")
-                                    for issue in resource['misconfigurations']:
-                                        print(f"- {issue['type']}: {issue['description']}")
-                        
-                        elif message_type == 'changes_detected':
-                            changes = data.get('changes', {})
-                            scan_duration = data.get('scan_duration', 0)
-                            print(f"Changes detected (scan took {scan_duration:.2f} seconds):")
+                            # Pretty print the received data
+                            print("\nReceived update:")
+                            message_type = data.get('type', 'unknown')
                             
-                            for service, service_changes in changes.items():
-                                print(f"\n{service} changes:")
-                                if service_changes.get('new_issues'):
-                                    print(f"New issues: {len(service_changes['new_issues'])}")
-                                if service_changes.get('resolved_issues'):
-                                    print(f"Resolved issues: {len(service_changes['resolved_issues'])}")
-                                if service_changes.get('changed_issues'):
-                                    print(f"Changed issues: {len(service_changes['changed_issues'])}")
-                        
-                        else:
-                            print(f"Message type: {message_type}")
-                            print(json.dumps(data, indent=2))
-                        
-                        if "error" in data:
-                            logger.error(f"Error from server: {data['error']}")
-                            break
+                            if message_type == 'service_scan_complete':
+                                service = data.get('service', 'unknown')
+                                scan_data = data.get('data', [])
+                                print(f"Service scan completed: {service}")
+                                print(f"Found {len(scan_data)} resources")
+                                
+                                scan_ts = data.get('timestamp')
+                                reported = services_by_scan[scan_ts]
+                                reported.add(service)
+                                if (done is not None and changes_applied is not None and changes_applied.done()
+                                        and scan_ts and reported >= MONITORED_SERVICES
+                                        and parse_scan_timestamp(scan_ts) >= changes_applied.result()):
+                                    done.set()
+                                
+                                # Print misconfigurations if any
+                                for resource in scan_data:
+                                    if resource.get('misconfigurations'):
+                                        print(f"Misconfigurations found in {resource['resource_id']}:")
+                                        for issue in resource['misconfigurations']:
+                                            print(f"- {issue['type']}: {issue['description']}")
+                            
+                            elif message_type == 'changes_detected':
+                                changes = data.get('changes', {})
+                                scan_duration = data.get('scan_duration', 0)
+                                print(f"Changes detected (scan took {scan_duration:.2f} seconds):")
+                                
+                                for service, service_changes in changes.items():
+                                    print(f"\n{service} changes:")
+                                    if service_changes.get('new_issues'):
+                                        print(f"New issues: {len(service_changes['new_issues'])}")
+                                    if service_changes.get('resolved_issues'):
+                                        print(f"Resolved issues: {len(service_changes['resolved_issues'])}")
+                                    if service_changes.get('changed_issues'):
+                                        print(f"Changed issues: {len(service_changes['changed_issues'])}")
+                            
+                            else:
+                                print(f"Message type: {message_type}")
+                                if logger.isEnabledFor(logging.DEBUG):
+                                    logger.debug("Frame:\n%s", orjson.dumps(data, option=orjson.OPT_INDENT_2).decode())
                             
-                    except websockets.exceptions.ConnectionClosed:
-                        logger.warning("WebSocket connection closed")
-                        break
+                            if "error" in data:
+                                logger.error(f"Error from server: {data['error']}")
+                                break
+                                
+                        except websockets.exceptions.ConnectionClosed:
+                            logger.warning("WebSocket connection closed")
+                            break
+                finally:
+                    if force_scan_task is not None:
+                        force_scan_task.cancel()
                         
         except Exception as e:
             logger.error(f"Connection attempt {attempt + 1} failed: {str(e)}")
@@ -107,6 +172,21 @@ async def connect_websocket():
                 logger.error("Failed to connect after all retries")
                 raise
 
+def delete_all_object_versions(s3, bucket_name: str):
+    """Delete every object version and delete marker in a bucket, one bulk request per page"""
+    paginator = s3.get_paginator('list_object_versions')
+    for page in paginator.paginate(Bucket=bucket_name):
+        objects = [
+            {'Key': item['Key'], 'VersionId': item['VersionId']}
+            for item in page.get('Versions', []) + page.get('DeleteMarkers', [])
+        ]
+        # delete_objects accepts at most 1000 keys per request
+        for start in range(0, len(objects), 1000):
+            s3.delete_objects(
+                Bucket=bucket_name,
+                Delete={'Objects': objects[start:start + 1000], 'Quiet': True}
+            )
+
 async def cleanup_resources(bucket_name: str):
     """Clean up test resources"""
     if not bucket_name:
@@ -114,23 +194,18 @@ async def cleanup_resources(bucket_name: str):
         
     print("\nCleaning up resources...")
     try:
-        s3 = boto3.client('s3')
+        s3 = get_s3_client()
         
-        # Delete all objects
+        # Delete all objects, including every version since the bucket is versioned
         try:
-            objects = s3.list_objects_v2(Bucket=bucket_name).get('Contents', [])
-            if objects:
-                s3.delete_objects(
-                    Bucket=bucket_name,
-                    Delete={'Objects': [{'Key': obj['Key']} for obj in objects]}
-                )
+            await asyncio.to_thread(delete_all_object_versions, s3, bucket_name)
         except Exception as e:
             print(f"Error deleting objects: {str(e)}")
             logger.error(f"Error deleting objects: {str(e)}")
         
         # Delete bucket
         try:
-            s3.delete_bucket(Bucket=bucket_name)
+            await asyncio.to_thread(s3.delete_bucket, Bucket=bucket_name)
             print(f"Cleaned up test bucket: {bucket_name}")
         except Exception as e:
             print(f"Error deleting bucket: {str(e)}")
@@ -151,18 +226,24 @@ async def main():
         logger.error(f"Error starting monitoring: {str(e)}")
     
     # Start WebSocket connection
-    websocket_task = asyncio.create_task(connect_websocket())
+    done = asyncio.Event()
+    changes_applied = asyncio.get_running_loop().create_future()
+    websocket_task = asyncio.create_task(connect_websocket(done, changes_applied))
     
     # Create test resources
-    bucket_name = create_test_resources()
+    bucket_name = await create_test_resources()
     
     if bucket_name:
+        # Only scans that start from here on can have seen the changes
+        changes_applied.set_result(datetime.now(timezone.utc))
         print(f"\nTest bucket created: {bucket_name}")
         print("Monitoring for changes... (Press Ctrl+C to exit)")
         
         try:
-            # Keep the script running to receive updates
-            await asyncio.sleep(60)  # Monitor for 1 minute
+            # Receive updates until a full scan started after the changes is reported, with a ceiling
+            await asyncio.wait_for(done.wait(), timeout=MONITOR_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"\nNo complete scan within {MONITOR_TIMEOUT} seconds")
         except KeyboardInterrupt:
             print("\nStopping test...")
         finally:
@@ -176,39 +257,34 @@ async def main():
     except asyncio.CancelledError:
         pass
 
-def create_test_resources():
+async def create_test_resources():
     """Create test AWS resources with various configurations"""
     print("\nCreating test resources...")
-    s3 = boto3.client('s3')
+    s3 = get_s3_client()
     bucket_name = f"cloudmisscan-test-{int(time.time())}"
     
     try:
-        # Create bucket
+        # Create bucket; S3 calls run in worker threads so the websocket loop keeps receiving
         print(f"\nCreating bucket: {bucket_name}")
-        s3.create_bucket(Bucket=bucket_name)
+        await asyncio.to_thread(s3.create_bucket, Bucket=bucket_name)
         print("Bucket created successfully")
         
         # Wait for bucket to be available
-        time.sleep(5)
+        await asyncio.sleep(5)
         
-        # Make some configuration changes
+        # Make some configuration changes; they are independent, so apply them concurrently
         print("\nMaking configuration changes...")
         
-        try:
+        versioning, encryption = await asyncio.gather(
             # 1. Enable versioning
-            s3.put_bucket_versioning(
+            asyncio.to_thread(
+                s3.put_bucket_versioning,
                 Bucket=bucket_name,
                 VersioningConfiguration={'Status': 'Enabled'}
-            )
-            print("Enabled versioning")
-        except Exception as e:
-            print(f"Error enabling versioning: {str(e)}")
-        
-        time.sleep(5)
-        
-        try:
+            ),
             # 2. Enable encryption
-            s3.put_bucket_encryption(
+            asyncio.to_thread(
+                s3.put_bucket_encryption,
                 Bucket=bucket_name,
                 ServerSideEncryptionConfiguration={
                     'Rules': [{
@@ -217,12 +293,19 @@ def create_test_resources():
                         }
                     }]
                 }
-            )
+            ),
+            return_exceptions=True
+        )
+        if isinstance(versioning, Exception):
+            print(f"Error enabling versioning: {str(versioning)}")
+        else:
+            print("Enabled versioning")
+        if isinstance(encryption, Exception):
+            print(f"Error enabling encryption: {str(encryption)}")
+        else:
             print("Enabled encryption")
-        except Exception as e:
-            print(f"Error enabling encryption: {str(e)}")
         
-        time.sleep(5)
+        await asyncio.sleep(5)
         
         # We'll skip logging configuration as it requires a valid target bucket
         print("Skipping logging configuration (requires existing target bucket)")
@@ -234,6 +317,9 @@ def create_test_resources():
         return None
 
 if __name__ == "__main__":
+    # libuv-backed loop for the websocket receive loop when available
+    if uvloop is not None:
+        uvloop.install()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
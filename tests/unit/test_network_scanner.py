@@ -5,21 +5,23 @@ from services.network_scanner import NetworkScanner
 from datetime import datetime
 
 class TestNetworkScanner(unittest.TestCase):
-    @patch('boto3.Session')
-    def setUp(self, mock_session):
-        self.mock_ec2_client = MagicMock()
-        mock_session.return_value.client.return_value = self.mock_ec2_client
-        self.session = mock_session
-        self.network_scanner = NetworkScanner(self.session.return_value)
+    @classmethod
+    def setUpClass(cls):
+        # Build the mocked session and scanner once for the whole class
+        with patch('boto3.Session') as mock_session:
+            cls.mock_ec2_client = MagicMock()
+            mock_session.return_value.client.return_value = cls.mock_ec2_client
+            cls.session = mock_session
+            cls.network_scanner = NetworkScanner(cls.session.return_value)
 
-    @patch('boto3.Session.client')
-    def test_scan_network_acls(self, mock_client):
-        # Mock EC2 client response
-        mock_ec2 = MagicMock()
-        mock_client.return_value = mock_ec2
-        
-        # Sample Network ACL response
-        mock_ec2.describe_network_acls.return_value = {
+    def setUp(self):
+        # Clear recorded calls between tests; each test configures its own return values
+        self.mock_ec2_client.reset_mock()
+
+    def test_scan_network_acls(self):
+        # Sample Network ACL response, returned as a single paginator page
+        paginator = self.mock_ec2_client.get_paginator.return_value
+        paginator.paginate.return_value = [{
             'NetworkAcls': [
                 {
                     'NetworkAclId': 'acl-12345',
@@ -37,7 +39,7 @@ class TestNetworkScanner(unittest.TestCase):
                     'Tags': []
                 }
             ]
-        }
+        }]
 
         results = self.network_scanner.scan_network_acls()
 
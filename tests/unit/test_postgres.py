@@ -1,44 +1,66 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from models.database import ScanResult, Report
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def test_postgres_connection():
-    """Test PostgreSQL connection and queries"""
-    try:
-        # Get database URL from environment
+# Engine and session factory shared by every call in the process, created on first use
+_Session = None
+
+def _get_session_factory():
+    """Create the one-shot engine and session factory once"""
+    global _Session
+    if _Session is None:
         from dotenv import load_dotenv
         import os
         load_dotenv()
         
         DATABASE_URL = os.getenv("DATABASE_URL")
-        engine = create_engine(DATABASE_URL)
-        Session = sessionmaker(bind=engine)
-        session = Session()
+        # A single connect-query-exit check gains nothing from pooling
+        engine = create_engine(
+            DATABASE_URL,
+            poolclass=NullPool,
+            connect_args={"options": "-c statement_timeout=5000"}
+        )
+        _Session = sessionmaker(bind=engine)
+    return _Session
+
+def test_postgres_connection():
+    """Test PostgreSQL connection and queries"""
+    session = None
+    try:
+        session = _get_session_factory()()
         
         # Test queries
         logger.info("\nTesting PostgreSQL Connection:")
         logger.info("-" * 50)
         
-        # Count records
-        scan_count = session.query(ScanResult).count()
-        report_count = session.query(Report).count()
+        # Count records and fetch the latest scan in a single round trip;
+        # the LEFT JOIN keeps the counts row even when there are no scans
+        row = session.execute(text(
+            f"SELECT (SELECT count(*) FROM {ScanResult.__tablename__}) AS scan_count, "
+            f"(SELECT count(*) FROM {Report.__tablename__}) AS report_count, "
+            "latest.id, latest.scan_date, latest.service_type, latest.resource_id "
+            "FROM (SELECT 1) AS one LEFT JOIN ("
+            f"SELECT id, scan_date, service_type, resource_id FROM {ScanResult.__tablename__} "
+            "ORDER BY scan_date DESC LIMIT 1"
+            ") AS latest ON true"
+        )).one()
         
         logger.info(f"\nTotal Records:")
-        logger.info(f"Scan Results: {scan_count}")
-        logger.info(f"Reports: {report_count}")
+        logger.info(f"Scan Results: {row.scan_count}")
+        logger.info(f"Reports: {row.report_count}")
         
-        # Get latest scan
-        latest_scan = session.query(ScanResult).order_by(ScanResult.scan_date.desc()).first()
-        if latest_scan:
+        # Latest scan
+        if row.id is not None:
             logger.info(f"\nLatest Scan:")
-            logger.info(f"ID: {latest_scan.id}")
-            logger.info(f"Date: {latest_scan.scan_date}")
-            logger.info(f"Service: {latest_scan.service_type}")
-            logger.info(f"Resource: {latest_scan.resource_id}")
+            logger.info(f"ID: {row.id}")
+            logger.info(f"Date: {row.scan_date}")
+            logger.info(f"Service: {row.service_type}")
+            logger.info(f"Resource: {row.resource_id}")
         
         logger.info("\nPostgreSQL connection test completed successfully!")
         return True
@@ -48,7 +70,8 @@ def test_postgres_connection():
         return False
     
     finally:
-        session.close()
+        if session is not None:
+            session.close()
 
 if __name__ == "__main__":
     test_postgres_connection()